@@ -8,6 +8,7 @@ Creates albums YYYY_MM_photo / YYYY_MM_video
 Automatically handles quota errors (429 Too Many Requests)
 Saves JSON report and detailed log
 Optimizations to prevent quota overruns:
+   - Batch uploads (one rclone call per album folder, not per file)
    - Album caching (avoids repeated checks)
    - Precise API request counting (accounts for different operation types)
    - Safety reserve of requests (100 requests)
@@ -16,14 +17,52 @@ Optimizations to prevent quota overruns:
 
 import os
 import re
+import sys
 import json
+import itertools
+import http.client
+import atexit
 import time
+import shutil
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timedelta, time as dt_time
 from dotenv import load_dotenv
-from collections import defaultdict
-import pytz
+from collections import Counter, defaultdict, deque, namedtuple
+from zoneinfo import ZoneInfo
+
+try:
+    import orjson  # Optional: much faster on large state files
+except ImportError:
+    orjson = None
+
+
+def json_loads(data):
+    """Parses JSON from bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_default(obj):
+    """Serializes values JSON has no type for: sets as sorted lists, datetimes as ISO strings."""
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(obj, indent=False):
+    """Serializes obj to JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(
+        obj, default=json_default, indent=2 if indent else None, ensure_ascii=False
+    ).encode("utf-8")
 
 # ==============================
 # CONFIG
@@ -35,11 +74,56 @@ GPHOTOS = os.getenv("GPHOTOS_REMOTE", "gphotos")
 SOURCE_PATH = os.getenv("SOURCE_PATH", "Photo")
 LOG_DIR = os.path.expanduser(os.getenv("LOG_DIR", "~/gphoto_logs"))
 MAX_PARALLEL_UPLOADS = int(os.getenv("MAX_PARALLEL_UPLOADS", 2))
+# Drive listing isn't limited by the Photos quota, so top-level folders are listed wider
+LISTING_WORKERS = int(os.getenv("LISTING_WORKERS", 8))
 UPLOAD_TIMEOUT = int(os.getenv("UPLOAD_TIMEOUT", 600))
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", 100))
+UPLOAD_ATTEMPTS = 5  # rclone calls per batch in a row without any file copied
+# Upper bound for rclone --transfers, which starts at MAX_PARALLEL_UPLOADS and is tuned per batch
+MAX_TRANSFERS = int(os.getenv("MAX_TRANSFERS", 32))
+UPLOAD_BWLIMIT = os.getenv("UPLOAD_BWLIMIT")  # rclone --bwlimit, unset = unlimited
+# rclone groups uploaded files into one mediaItems.batchCreate call (max 50).
+# Unset = rclone defaults (sync mode, batch size = --transfers).
+GPHOTOS_BATCH_MODE = os.getenv("GPHOTOS_BATCH_MODE")  # sync / async / off
+GPHOTOS_BATCH_SIZE = os.getenv("GPHOTOS_BATCH_SIZE")
+# Run uploads through one long-lived 'rclone rcd' daemon instead of one rclone
+# process per batch (saves process startup, config parsing and token refresh)
+RCLONE_RC = os.getenv("RCLONE_RC", "false").lower() in ("1", "true", "yes")
+# Resolved once, so rclone isn't searched in PATH for every command
+RCLONE_BIN = shutil.which("rclone") or "rclone"
+RCLONE_RC_ADDR = os.getenv("RCLONE_RC_ADDR", "127.0.0.1:5572")
+# rclone rc core/transferred keeps only the last 100 transfers of a stats group
+RC_TRANSFERRED_LIMIT = 100
 
 Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
-LOG_PATH = Path(LOG_DIR) / f"sync_{datetime.now():%Y%m%d_%H%M%S}.log"
-SUMMARY_PATH = Path(LOG_DIR) / f"summary_{datetime.now():%Y%m%d_%H%M%S}.json"
+RUN_STAMP = f"{datetime.now():%Y%m%d_%H%M%S}"
+LOG_PATH = Path(LOG_DIR) / f"sync_{RUN_STAMP}.log"
+SUMMARY_PATH = Path(LOG_DIR) / f"summary_{RUN_STAMP}.json"
+# Opened once instead of on every log line, flushed every LOG_FLUSH_INTERVAL and at exit
+LOG_FH = open(LOG_PATH, "a", encoding="utf-8", buffering=1 << 16)
+LOG_FLUSH_INTERVAL = 1.0  # seconds
+LOG_CLOSED = threading.Event()
+
+
+def flush_log_periodically():
+    """Flushes LOG_FH in the background, so the log file can be followed live."""
+    while not LOG_CLOSED.wait(LOG_FLUSH_INTERVAL):
+        try:
+            LOG_FH.flush()
+        except ValueError:
+            return  # Closed at exit meanwhile
+
+
+def close_log():
+    """Stops the background flush and closes LOG_FH."""
+    LOG_CLOSED.set()
+    LOG_FH.close()
+
+
+threading.Thread(target=flush_log_periodically, name="log-flush", daemon=True).start()
+atexit.register(close_log)
+LOG_TS_SEC = 0  # Second of the cached log timestamp
+LOG_TS_STR = ""
 
 PHOTO_EXT = tuple(
     x.strip() for x in os.getenv("PHOTO_EXT", ".jpg,.jpeg,.png,.heic,.cr2").split(",")
@@ -50,6 +134,52 @@ VIDEO_EXT = tuple(
 IGNORED_EXT = tuple(
     x.strip() for x in os.getenv("IGNORED_EXT", ".thm,.lrv,.json").split(",")
 )
+# File extension → media kind, one dict lookup instead of two endswith() scans.
+# IGNORED_EXT goes last so it wins over PHOTO_EXT/VIDEO_EXT.
+EXT_KIND = {ext.lower(): "photo" for ext in PHOTO_EXT}
+EXT_KIND.update({ext.lower(): "video" for ext in VIDEO_EXT})
+EXT_KIND.update({ext.lower(): "ignore" for ext in IGNORED_EXT})
+
+# YYYY_MM in filename (see detect_from_name)
+DATE_RE = re.compile(r"(19|20\d{2})[-_.]?(0[1-9]|1[0-2])")
+
+# rclone/Google error messages, each list matched in one case-insensitive pass
+DAILY_QUOTA_RE = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            [
+                "all requests per day",
+                "quota exceeded for quota metric 'all requests'",
+                "quota metric 'all requests' and limit 'all requests per day'",
+            ],
+        )
+    ),
+    re.IGNORECASE,
+)
+# Temporary quota errors, retried after a pause (daily quota is checked first)
+RATE_LIMIT_RE = re.compile("quota exceeded|too many requests|rate limit", re.IGNORECASE)
+NONRECOVERABLE_RE = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            [
+                "error while trying to create this media item",
+                "upload failed: failed: there was an error while trying to create this media item",
+                "it may be damaged or use a file format that preview doesn't recognize",
+            ],
+        )
+    ),
+    re.IGNORECASE,
+)
+# Typographic quotes (U+2018, U+2019) → regular apostrophe (U+0027)
+APOSTROPHES = str.maketrans({"\u2018": "'", "\u2019": "'"})
+
+# Google API quotas reset at midnight Pacific time
+PST = ZoneInfo("America/Los_Angeles")
+# Current quota day, cached by get_pst_day() until reset_ts
+PstDay = namedtuple("PstDay", "date date_str start_ts reset_time reset_ts")
+PST_DAY = None
 
 # Quota limit constants
 API_QUOTA_LIMIT = 10000  # requests per day
@@ -58,46 +188,127 @@ WARNING_THRESHOLD = 0.8  # 80%
 CRITICAL_THRESHOLD = 0.9  # 90%
 STOP_THRESHOLD = 0.95  # 95% - more conservative approach, leaving a reserve
 SAFETY_RESERVE = 300  # Request reserve for unexpected operations and retries
+# Request counts for the thresholds above, used by check_api_quota
+WARNING_LIMIT = int(API_QUOTA_LIMIT * WARNING_THRESHOLD)
+STOP_LIMIT = int(API_QUOTA_LIMIT * STOP_THRESHOLD)
+EFFECTIVE_LIMIT = API_QUOTA_LIMIT - SAFETY_RESERVE
+UPLOAD_WARNING_LIMIT = int(UPLOAD_QUOTA_LIMIT * WARNING_THRESHOLD)  # bytes, check_upload_quota
 
 STATE_FILE = Path(LOG_DIR) / "state.json"
+# Append-only log of files uploaded since the last state.json snapshot
+STATE_WAL = Path(LOG_DIR) / "state.wal"
+STATE_WAL_FSYNC_EVERY = 20  # fsync WAL every 20 entries
+STATE_SNAPSHOT_EVERY = 500  # Rewrite state.json and truncate WAL every 500 entries
 FAILED_FILE = Path(LOG_DIR) / "failed.json"
+# Append-only log (JSON lines) of failures since the last failed.json snapshot
+FAILED_WAL = Path(LOG_DIR) / "failed.wal"
+TRANSFERS_FILE = Path(LOG_DIR) / "transfers.json"  # Last tuned --transfers (see TransferTuner)
+
+
+def read_wal_lines(path):
+    """Returns complete lines (bytes) of a WAL file.
+
+    A last line without newline is a torn write from a crash: it is cut off
+    the file, so entries appended next start on a line of their own.
+    """
+    if not path.exists():
+        return []
+    data = path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with open(path, "r+b") as wal_file:
+            wal_file.truncate(end)
+    return data[:end].splitlines()
+
+
 if STATE_FILE.exists():
     try:
-        with open(STATE_FILE, "r") as state_file:
-            DONE = set(json.load(state_file))
+        DONE = set(json_loads(STATE_FILE.read_bytes()))
     except Exception:
         DONE = set()
 else:
     DONE = set()
 
+DONE.update(line.decode("utf-8") for line in read_wal_lines(STATE_WAL) if line)
+STATE_WAL_FH = open(STATE_WAL, "a", encoding="utf-8")
+WAL_UNSYNCED = 0  # WAL entries written since last fsync
+WAL_ENTRIES = 0  # WAL entries written since last snapshot
+
 try:
-    with open(FAILED_FILE, "r") as failed_file:
-        failed_raw = json.load(failed_file)
-        if isinstance(failed_raw, dict):
-            FAILED = failed_raw
-        elif isinstance(failed_raw, list):
-            FAILED = {
-                path: {
-                    "reason": "previous failure (legacy list entry)",
-                    "timestamp": None,
-                }
-                for path in failed_raw
+    failed_raw = json_loads(FAILED_FILE.read_bytes())
+    if isinstance(failed_raw, dict):
+        FAILED = failed_raw
+    elif isinstance(failed_raw, list):
+        FAILED = {
+            path: {
+                "reason": "previous failure (legacy list entry)",
+                "timestamp": None,
             }
-        else:
-            FAILED = {}
+            for path in failed_raw
+        }
+    else:
+        FAILED = {}
 except Exception:
     FAILED = {}
 
+for line in read_wal_lines(FAILED_WAL):
+    try:
+        entry = json_loads(line)
+        FAILED[entry.pop("path")] = entry
+    except (ValueError, KeyError, TypeError, AttributeError):
+        continue  # Not a failed-file record, skip it
+FAILED_WAL_FH = open(FAILED_WAL, "ab")
+FAILED_WAL_ENTRIES = 0  # Failures written since last snapshot
+
 DAILY_QUOTA_FILE = Path(LOG_DIR) / "daily_quota.json"
+DAILY_QUOTA_WRITTEN = b""  # Contents of the last daily_quota.json write
+QUOTA_FLUSH_INTERVAL = 5  # seconds between daily_quota.json writes
+
+# In-memory copy of daily_quota.json (see load_daily_quota/flush_daily_quota)
+QUOTA_CACHE = None
+QUOTA_DIRTY = False
+QUOTA_LAST_FLUSH = 0.0
+
+# Drive listing is reused for re-runs within this time (0 disables cache)
+LISTING_CACHE_FILE = Path(LOG_DIR) / "drive_listing.json"
+LISTING_CACHE_TTL = int(os.getenv("LISTING_CACHE_TTL", 6 * 3600))  # seconds
 
 # Cache for tracking albums that have already been used (to avoid repeated checks)
 KNOWN_ALBUMS = set()
 
+# Learned API requests per uploaded file, per album: {album: [ema, files]}
+REQUESTS_STATS_FILE = Path(LOG_DIR) / "requests_stats.json"
+REQUESTS_PER_FILE_DEFAULT = 2.0  # Upload + share of batchCreate, until learned
+REQUESTS_EMA_ALPHA = 0.2
+REQUESTS_HISTORY_SIZE = 50  # Recent samples averaged for albums without stats
+try:
+    requests_raw = json_loads(REQUESTS_STATS_FILE.read_bytes())
+    if "albums" not in requests_raw:
+        requests_raw = {"albums": requests_raw}  # Older file: just the album map
+    REQUESTS_STATS = requests_raw["albums"]
+    REQUESTS_HISTORY = deque(requests_raw.get("recent", []), maxlen=REQUESTS_HISTORY_SIZE)
+except Exception:
+    REQUESTS_STATS = {}
+    REQUESTS_HISTORY = deque(maxlen=REQUESTS_HISTORY_SIZE)
+REQUESTS_HISTORY_SUM = sum(REQUESTS_HISTORY)
+REQUESTS_STATS_DIRTY = False
+LAST_API_REQUESTS = None  # Monitoring API value the current window started at
+WINDOW_UPLOADS = defaultdict(int)  # Files uploaded per album since then
+
 # Quota synchronization tracking
 LAST_SYNC_TIME = None
 LAST_SYNC_UPLOADS = 0
 SYNC_INTERVAL_UPLOADS = 15  # Sync every 15 uploads
 SYNC_INTERVAL_SECONDS = 300  # Sync every 5 minutes
+QUOTA_SYNC_EVENT = threading.Event()  # Set when a sync is due
+QUOTA_SYNC_STOP = threading.Event()
+# Set on Ctrl-C: running rclone processes are stopped and nothing is retried
+STOP_EVENT = threading.Event()
+# Set when an upload hits the daily quota: albums and batches not yet started are skipped
+QUOTA_STOP_EVENT = threading.Event()
+
+# Guards DONE, FAILED, METRICS, QUOTA_CACHE and their files (uploads run in threads)
+STATE_LOCK = threading.RLock()
 
 METRICS = {
     "started": datetime.now().isoformat(),
@@ -106,7 +317,7 @@ METRICS = {
     "uploaded_files": 0,
     "errors": 0,
     "albums_created": set(),
-    "by_album": defaultdict(int),
+    "by_album": Counter(),
     "duration_sec": 0.0,
     "quota_exceeded": False,
     "quota_reset_time": None,
@@ -117,11 +328,20 @@ METRICS = {
 
 
 def log(msg: str):
-    ts = datetime.now().strftime("%H:%M:%S")
-    line = f"[{ts}] {msg}"
+    global LOG_TS_SEC, LOG_TS_STR
+    # Format the timestamp once per second, not once per line
+    sec = int(time.time())
+    if sec != LOG_TS_SEC:
+        LOG_TS_STR = time.strftime("%H:%M:%S", time.localtime(sec))
+        LOG_TS_SEC = sec
+    line = f"[{LOG_TS_STR}] {msg}"
     print(line)
-    with open(LOG_PATH, "a") as f:
-        f.write(line + "\n")
+    if LOG_CLOSED.is_set():
+        return  # Daemon thread logging after close_log() at exit
+    try:
+        LOG_FH.write(line + "\n")
+    except ValueError:
+        pass  # Closed by close_log() meanwhile
 
 
 class QuotaExceededError(Exception):
@@ -135,38 +355,187 @@ class QuotaExceededError(Exception):
         )
 
 
+class UploadLimiter:
+    """Limits concurrent uploads, halving the limit for a while after rate limiting."""
+
+    def __init__(self, limit: int, backoff_seconds: int = 60):
+        self.max_limit = max(1, limit)
+        self.limit = self.max_limit
+        self.backoff_seconds = backoff_seconds
+        self.backoff_until = 0.0
+        self.active = 0
+        self.cond = threading.Condition()
+
+    def __enter__(self):
+        with self.cond:
+            while True:
+                if self.limit < self.max_limit and time.monotonic() >= self.backoff_until:
+                    self.limit = self.max_limit
+                    log(f"Rate limit backoff over, concurrent uploads: {self.limit}")
+                if self.active < self.limit:
+                    break
+                # Wake up periodically to notice end of backoff
+                self.cond.wait(timeout=1)
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def rate_limited(self):
+        """Halves concurrency for backoff_seconds."""
+        with self.cond:
+            self.backoff_until = time.monotonic() + self.backoff_seconds
+            if self.limit > 1:
+                self.limit //= 2
+                log(
+                    f"Rate limited, reducing concurrent uploads to {self.limit} for {self.backoff_seconds} sec"
+                )
+
+
+UPLOAD_LIMITER = UploadLimiter(MAX_PARALLEL_UPLOADS)
+
+
+class TransferTuner:
+    """Tunes rclone --transfers by comparing throughput of windows of batches.
+
+    After each window of batches one transfer more is tried. It is kept only
+    if the next window is more than 5% faster; otherwise one transfer less
+    than before is tried, and kept while throughput stays within 5%, so
+    transfers comes down when the earlier level is just as fast. When
+    neither pays off transfers stays put for a few windows. Rate limiting
+    halves it.
+    """
+
+    def __init__(self, path: Path, start: int, max_transfers: int, window: int = 5, hold: int = 4):
+        self.path = path
+        self.max_transfers = max(1, max_transfers)
+        self.window = window  # Successful batches per throughput sample
+        self.hold = hold  # Windows without a probe after both directions failed
+        self.lock = threading.Lock()
+        try:
+            start = int(json_loads(path.read_bytes())["transfers"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        self.transfers = min(max(1, start), self.max_transfers)
+        self.reset()
+
+    def reset(self):
+        """Starts measuring from scratch (after rate limiting)."""
+        self.window_batches = 0
+        self.window_bytes = 0
+        self.window_seconds = 0.0
+        self.previous = None  # bytes/sec of the last window at a kept value
+        self.probe = 0  # +1 / -1 if transfers was changed for the current window
+        self.holding = 0
+
+    def record(self, uploaded_bytes: int, seconds: float, transfers: int):
+        """Takes throughput of a successful batch run with transfers into account."""
+        if uploaded_bytes <= 0 or seconds <= 0:
+            return
+        with self.lock:
+            if transfers != self.transfers:
+                return  # Started before the last change, measures the old value
+            self.window_batches += 1
+            self.window_bytes += uploaded_bytes
+            self.window_seconds += seconds
+            if self.window_batches < self.window:
+                return
+            rate = self.window_bytes / self.window_seconds
+            self.window_batches = 0
+            self.window_bytes = 0
+            self.window_seconds = 0.0
+
+            if self.probe > 0 and rate <= 1.05 * self.previous:
+                # No gain from one more, try one less than before
+                self.transfers -= 2 if self.transfers > 2 else 1
+                self.probe = -1 if self.transfers < transfers - 1 else 0
+                self.holding = 0 if self.probe else self.hold
+                return
+            if self.probe < 0 and rate < 0.95 * self.previous:
+                # One less is slower, the earlier value was right
+                self.transfers += 1
+                self.probe = 0
+                self.holding = self.hold
+                return
+            if self.probe:
+                self.save()  # Faster, or as fast with fewer transfers
+            self.previous = rate
+            if self.holding:
+                self.holding -= 1
+                return
+            if self.probe >= 0 and self.transfers < self.max_transfers:
+                self.transfers += 1
+                self.probe = 1
+            elif self.transfers > 1:
+                self.transfers -= 1
+                self.probe = -1
+            else:
+                self.probe = 0
+
+    def rate_limited(self):
+        """Halves transfers (multiplicative decrease)."""
+        with self.lock:
+            if self.transfers > 1:
+                self.transfers //= 2
+                log(f"Rate limited, reducing rclone transfers to {self.transfers}")
+                self.save()
+            self.reset()
+
+    def save(self):
+        """Persists transfers, so the next run starts from the last good value."""
+        write_file_atomic(self.path, json_dumps({"transfers": self.transfers}))
+
+
+TRANSFER_TUNER = TransferTuner(TRANSFERS_FILE, MAX_PARALLEL_UPLOADS, MAX_TRANSFERS)
+
+
 def is_daily_quota_exceeded(stderr: str) -> bool:
     """Determines if daily quota limit has been reached."""
-    stderr_lower = stderr.lower()
-    daily_quota_indicators = [
-        "all requests per day",
-        "quota exceeded for quota metric 'all requests'",
-        "quota metric 'all requests' and limit 'all requests per day'",
-    ]
-    return any(indicator in stderr_lower for indicator in daily_quota_indicators)
+    return DAILY_QUOTA_RE.search(stderr) is not None
+
+
+def get_pst_day():
+    """Returns the current PstDay, computed once per day (at midnight PST)."""
+    global PST_DAY
+    if PST_DAY is None or time.time() >= PST_DAY.reset_ts:
+        today = datetime.now(PST).date()
+        start = datetime.combine(today, dt_time.min, tzinfo=PST)
+        # Calculate midnight of the next day in PST
+        reset_time = datetime.combine(today + timedelta(days=1), dt_time.min, tzinfo=PST)
+        PST_DAY = PstDay(today, today.isoformat(), start.timestamp(), reset_time, reset_time.timestamp())
+    return PST_DAY
 
 
 def get_current_pst_date():
     """Returns current date in PST."""
-    pst = pytz.timezone("America/Los_Angeles")
-    return datetime.now(pst).date()
+    return get_pst_day().date
+
+
+def get_current_pst_date_str():
+    """Returns current date in PST as YYYY-MM-DD (daily_quota.json key)."""
+    return get_pst_day().date_str
 
 
 def get_quota_reset_time():
     """Calculates the time of the next quota reset (midnight PST of the next day)."""
-    # Get current time in PST
-    pst = pytz.timezone("America/Los_Angeles")
-    now_pst = datetime.now(pst)
+    day = get_pst_day()
+    # Calculate number of seconds until reset
+    seconds_until_reset = int(day.reset_ts - time.time())
 
-    # Calculate midnight of the next day in PST
-    next_day = now_pst.date() + timedelta(days=1)
-    reset_time_naive = datetime.combine(next_day, dt_time.min)
-    reset_time = pst.localize(reset_time_naive)
+    return day.reset_time, seconds_until_reset
 
-    # Calculate number of seconds until reset
-    seconds_until_reset = int((reset_time - now_pst).total_seconds())
 
-    return reset_time, seconds_until_reset
+# Correct metric: serviceruntime.googleapis.com/api/request_count
+# Filter by service: photoslibrary.googleapis.com
+QUOTA_METRIC_FILTER = (
+    'metric.type = "serviceruntime.googleapis.com/api/request_count" '
+    'AND resource.labels.service = "photoslibrary.googleapis.com"'
+)
+MONITORING_CLIENT = None  # Created on first get_real_quota_usage() call
+MONITORING_LOCK = threading.Lock()
 
 
 def get_real_quota_usage():
@@ -178,6 +547,7 @@ def get_real_quota_usage():
     
     Returns (api_requests, uploaded_bytes) or None on error.
     """
+    global MONITORING_CLIENT
     project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
     if not project_id:
         # Don't log here - this is expected if GOOGLE_CLOUD_PROJECT_ID is not set
@@ -194,49 +564,39 @@ def get_real_quota_usage():
         return None
     
     try:
-        # Get credentials
-        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if credentials_path and os.path.exists(credentials_path):
-            credentials = service_account.Credentials.from_service_account_file(
-                credentials_path,
-                scopes=["https://www.googleapis.com/auth/monitoring.read"]
-            )
-        else:
-            # Try to use Application Default Credentials
-            credentials, _ = google.auth.default(
-                scopes=["https://www.googleapis.com/auth/monitoring.read"]
-            )
-        
-        # Create Monitoring API client
-        client = monitoring_v3.MetricServiceClient(credentials=credentials)
+        # Reuse one Monitoring API client (and its gRPC channel) for all syncs
+        with MONITORING_LOCK:
+            if MONITORING_CLIENT is None:
+                # Get credentials
+                credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+                if credentials_path and os.path.exists(credentials_path):
+                    credentials = service_account.Credentials.from_service_account_file(
+                        credentials_path,
+                        scopes=["https://www.googleapis.com/auth/monitoring.read"]
+                    )
+                else:
+                    # Try to use Application Default Credentials
+                    credentials, _ = google.auth.default(
+                        scopes=["https://www.googleapis.com/auth/monitoring.read"]
+                    )
+                MONITORING_CLIENT = monitoring_v3.MetricServiceClient(credentials=credentials)
+        client = MONITORING_CLIENT
         project_name = f"projects/{project_id}"
         
-        # Calculate time range: from start of day PST to current time
-        pst = pytz.timezone("America/Los_Angeles")
-        now_pst = datetime.now(pst)
-        today_start_pst = datetime.combine(now_pst.date(), dt_time.min)
-        today_start_pst = pst.localize(today_start_pst)
-        
-        # Convert to UTC for API
-        today_start_utc = today_start_pst.astimezone(pytz.UTC)
-        now_utc = now_pst.astimezone(pytz.UTC)
+        # Time range: from start of day PST to current time (Unix time is UTC)
+        day_start_ts = get_pst_day().start_ts
         
         # Create time interval via _pb (protobuf object)
         interval = monitoring_v3.TimeInterval()
-        end_timestamp = timestamp_pb2.Timestamp(seconds=int(now_utc.timestamp()))
-        start_timestamp = timestamp_pb2.Timestamp(seconds=int(today_start_utc.timestamp()))
+        end_timestamp = timestamp_pb2.Timestamp(seconds=int(time.time()))
+        start_timestamp = timestamp_pb2.Timestamp(seconds=int(day_start_ts))
         interval._pb.end_time.CopyFrom(end_timestamp)
         interval._pb.start_time.CopyFrom(start_timestamp)
         
         # Create metric request
-        # Correct metric: serviceruntime.googleapis.com/api/request_count
-        # Filter by service: photoslibrary.googleapis.com
         request = monitoring_v3.ListTimeSeriesRequest()
         request.name = project_name
-        request.filter = (
-            'metric.type = "serviceruntime.googleapis.com/api/request_count" '
-            'AND resource.labels.service = "photoslibrary.googleapis.com"'
-        )
+        request.filter = QUOTA_METRIC_FILTER
         request.interval = interval
         
         # Configure aggregation via _pb
@@ -306,6 +666,7 @@ def sync_quota_from_api():
     Returns True if sync successful, False otherwise.
     Preserves uploaded_bytes value (not available from Monitoring API).
     """
+    global QUOTA_DIRTY
     real_usage = get_real_quota_usage()
     if real_usage is None:
         return False
@@ -314,68 +675,98 @@ def sync_quota_from_api():
     if api_requests is None:
         return False
     
-    # Load current data
-    current_date = get_current_pst_date()
-    date_str = current_date.isoformat()
-    
-    if DAILY_QUOTA_FILE.exists():
-        try:
-            with open(DAILY_QUOTA_FILE, "r") as f:
-                quota_data = json.load(f)
-            
-            if quota_data.get("date") == date_str:
-                old_requests = quota_data.get("api_requests", 0)
-                old_uploaded_bytes = quota_data.get("uploaded_bytes", 0)
-                # Sync if value changed or first sync
-                if api_requests != old_requests:
-                    diff = api_requests - old_requests
-                    # Only log significant changes (>10 requests) to reduce noise
-                    if abs(diff) > 10:
-                        log(f"Quota sync: {old_requests} → {api_requests} requests (diff: {diff:+d})")
-                    quota_data["api_requests"] = api_requests
-                    quota_data["quota_source"] = "api"
-                    # Preserve uploaded_bytes (not available from Monitoring API)
-                    if "uploaded_bytes" not in quota_data:
-                        quota_data["uploaded_bytes"] = old_uploaded_bytes
-                    save_daily_quota(quota_data)
-                    return True
-                else:
-                    # Value unchanged, but update source
-                    quota_data["quota_source"] = "api"
-                    # Preserve uploaded_bytes
-                    if "uploaded_bytes" not in quota_data:
-                        quota_data["uploaded_bytes"] = old_uploaded_bytes
-                    save_daily_quota(quota_data)
-                    return True
-        except Exception as e:
-            log(f"Warning: Failed to sync quota: {e}")
-            return False
-    else:
-        # File doesn't exist, create new with API data
-        quota_data = {
-            "date": date_str,
-            "api_requests": api_requests,
-            "uploaded_bytes": 0,  # New file, start from 0
-            "quota_source": "api"
-        }
-        save_daily_quota(quota_data)
+    # Make sure cache holds today's data (uploaded_bytes is preserved there)
+    with STATE_LOCK:
+        learn_requests_per_file(api_requests)
+        load_daily_quota()
+        old_requests = QUOTA_CACHE["api_requests"]
+        if api_requests != old_requests:
+            diff = api_requests - old_requests
+            # Only log significant changes (>10 requests) to reduce noise
+            if abs(diff) > 10:
+                log(f"Quota sync: {old_requests} → {api_requests} requests (diff: {diff:+d})")
+            QUOTA_CACHE["api_requests"] = api_requests
+            QUOTA_DIRTY = True
+        if QUOTA_CACHE.get("quota_source") != "api":
+            QUOTA_CACHE["quota_source"] = "api"
+            QUOTA_DIRTY = True
+        flush_daily_quota()
         return True
-    
-    return False
+
+
+def request_quota_sync():
+    """Wakes the quota sync thread if a Monitoring API sync is due."""
+    if (
+        LAST_SYNC_TIME is None
+        or (time.time() - LAST_SYNC_TIME) >= SYNC_INTERVAL_SECONDS
+        or LAST_SYNC_UPLOADS >= SYNC_INTERVAL_UPLOADS
+    ):
+        QUOTA_SYNC_EVENT.set()
+
+
+def quota_sync_loop():
+    """Runs Monitoring API syncs off the upload threads (see request_quota_sync)."""
+    global LAST_SYNC_TIME, LAST_SYNC_UPLOADS
+    while True:
+        QUOTA_SYNC_EVENT.wait(SYNC_INTERVAL_SECONDS)
+        if QUOTA_SYNC_STOP.is_set():
+            return
+        QUOTA_SYNC_EVENT.clear()
+        # A failed sync is retried after the interval, not on every upload
+        LAST_SYNC_TIME = time.time()
+        LAST_SYNC_UPLOADS = 0
+        sync_quota_from_api()
+
+
+def start_quota_sync():
+    """Starts the background Monitoring API sync thread."""
+    threading.Thread(target=quota_sync_loop, name="quota-sync", daemon=True).start()
+    atexit.register(stop_quota_sync)
+
+
+def stop_quota_sync():
+    """Stops the background Monitoring API sync thread."""
+    QUOTA_SYNC_STOP.set()
+    QUOTA_SYNC_EVENT.set()
 
 
 def load_daily_quota():
-    """Loads daily quotas, resets if new day.
+    """Returns (api_requests, uploaded_bytes) for today.
+
+    Quota data is read from disk only once per day; afterwards the in-memory
+    QUOTA_CACHE is used. The Monitoring API is asked at startup only, and
+    never while STATE_LOCK is held: upload threads need the lock for every
+    counter update. At PST midnight the sync thread fetches the new value.
+    """
+    global QUOTA_CACHE
+    with STATE_LOCK:
+        if QUOTA_CACHE is not None and QUOTA_CACHE["date"] == get_current_pst_date_str():
+            return QUOTA_CACHE["api_requests"], QUOTA_CACHE["uploaded_bytes"]
+        startup = QUOTA_CACHE is None
+
+    real_usage = get_real_quota_usage() if startup else None
+    with STATE_LOCK:
+        date_str = get_current_pst_date_str()
+        # Another thread may have loaded it meanwhile
+        if QUOTA_CACHE is None or QUOTA_CACHE["date"] != date_str:
+            if QUOTA_CACHE is not None:
+                # New day - write out yesterday's counters before reset
+                flush_daily_quota(force=True)
+                QUOTA_SYNC_EVENT.set()
+            QUOTA_CACHE = read_daily_quota(date_str, real_usage, startup)
+        return QUOTA_CACHE["api_requests"], QUOTA_CACHE["uploaded_bytes"]
+
+
+def read_daily_quota(date_str, real_usage=None, startup=True):
+    """Reads daily quotas from disk, resets if new day.
     
     Sync priority:
-    1. Real value from Google Cloud Monitoring API (if configured)
+    1. Real value from Google Cloud Monitoring API (real_usage, if fetched)
     2. Local saved value
     
     Preserves uploaded_bytes on restart (only resets on new day).
+    Returns quota data dict.
     """
-    current_date = get_current_pst_date()
-    date_str = current_date.isoformat()
-
     # Check for manual synchronization from environment variable
     initial_requests = os.getenv("INITIAL_API_REQUESTS")
     if initial_requests is not None:
@@ -386,8 +777,6 @@ def load_daily_quota():
             log(f"Warning: Invalid manual sync value, ignoring")
             initial_requests = None
 
-    # Attempt to get real value from API at startup
-    real_usage = get_real_quota_usage()
     api_requests_from_api = None
     if real_usage is not None:
         api_requests_from_api, _ = real_usage
@@ -396,8 +785,7 @@ def load_daily_quota():
 
     if DAILY_QUOTA_FILE.exists():
         try:
-            with open(DAILY_QUOTA_FILE, "r") as f:
-                quota_data = json.load(f)
+            quota_data = json_loads(DAILY_QUOTA_FILE.read_bytes())
 
             # Check if it's a new day
             if quota_data.get("date") == date_str:
@@ -408,6 +796,7 @@ def load_daily_quota():
                 # Ensure uploaded_bytes is preserved in quota_data
                 if "uploaded_bytes" not in quota_data:
                     quota_data["uploaded_bytes"] = uploaded_bytes
+                quota_data["api_requests"] = api_requests
                 
                 if api_requests_from_api is not None:
                     # Always update quota_source to "api" if Monitoring API is available
@@ -417,8 +806,7 @@ def load_daily_quota():
                         diff = api_requests_from_api - api_requests
                         if abs(diff) > 10:
                             log(f"Quota sync: {api_requests} → {api_requests_from_api} requests (diff: {diff:+d})")
-                        api_requests = api_requests_from_api
-                        quota_data["api_requests"] = api_requests
+                        quota_data["api_requests"] = api_requests_from_api
                         needs_save = True
                     # Update quota_source to "api" even if values match (Monitoring API is working)
                     if quota_data.get("quota_source") != "api":
@@ -426,19 +814,16 @@ def load_daily_quota():
                         needs_save = True
                     if needs_save:
                         save_daily_quota(quota_data)
-                    # Return updated values
-                    return api_requests, uploaded_bytes
                 elif initial_requests is not None and initial_requests > api_requests:
                     log(f"Syncing from manual: {api_requests} → {initial_requests} requests")
-                    api_requests = initial_requests
-                    quota_data["api_requests"] = api_requests
+                    quota_data["api_requests"] = initial_requests
                     quota_data["quota_source"] = "manual"
                     save_daily_quota(quota_data)
                 elif "quota_source" not in quota_data:
                     quota_data["quota_source"] = "local"
                     save_daily_quota(quota_data)
                 
-                return api_requests, uploaded_bytes
+                return quota_data
         except Exception:
             pass
 
@@ -463,7 +848,7 @@ def load_daily_quota():
     }
     save_daily_quota(quota_data)
     
-    if quota_source == "local":
+    if quota_source == "local" and startup:
         project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
         if project_id:
             log("Warning: Using local quota counter. Monitoring API sync unavailable (check credentials/permissions).")
@@ -471,58 +856,172 @@ def load_daily_quota():
         else:
             log("Warning: Using local quota counter. Set GOOGLE_CLOUD_PROJECT_ID for Monitoring API sync.")
     
-    return api_requests, 0
+    return quota_data
 
 
 def save_daily_quota(quota_data=None):
-    """Saves daily quotas."""
+    """Saves daily quotas (atomically, skipped if the file content wouldn't change)."""
     if quota_data is None:
         quota_data = {
-            "date": get_current_pst_date().isoformat(),
+            "date": get_current_pst_date_str(),
             "api_requests": 0,
             "uploaded_bytes": 0,
         }
-    with open(DAILY_QUOTA_FILE, "w") as f:
-        json.dump(quota_data, f, indent=2)
+    global DAILY_QUOTA_WRITTEN
+    data = json_dumps(quota_data, indent=True)
+    with STATE_LOCK:
+        # Counters often don't change between flushes
+        if data == DAILY_QUOTA_WRITTEN:
+            return
+        write_file_atomic(DAILY_QUOTA_FILE, data)
+        DAILY_QUOTA_WRITTEN = data
+
+
+def flush_daily_quota(force=False):
+    """Writes QUOTA_CACHE to disk if changed, at most every QUOTA_FLUSH_INTERVAL seconds."""
+    global QUOTA_DIRTY, QUOTA_LAST_FLUSH
+    with STATE_LOCK:
+        if not QUOTA_DIRTY or QUOTA_CACHE is None:
+            return
+        now = time.monotonic()
+        if not force and now - QUOTA_LAST_FLUSH < QUOTA_FLUSH_INTERVAL:
+            return
+        save_daily_quota(QUOTA_CACHE)
+        QUOTA_DIRTY = False
+        QUOTA_LAST_FLUSH = now
+
+
+# Don't lose counters written in the last QUOTA_FLUSH_INTERVAL seconds on exit
+atexit.register(flush_daily_quota, force=True)
 
 
 def increment_api_request():
-    """Increments API request counter and saves."""
-    api_requests, uploaded_bytes = load_daily_quota()
-    api_requests += 1
-    quota_data = {
-        "date": get_current_pst_date().isoformat(),
-        "api_requests": api_requests,
-        "uploaded_bytes": uploaded_bytes,
-    }
-    save_daily_quota(quota_data)
-    return api_requests
+    """Increments API request counter (flushed to disk by check_api_quota/at exit)."""
+    global QUOTA_DIRTY
+    with STATE_LOCK:
+        load_daily_quota()
+        QUOTA_CACHE["api_requests"] += 1
+        QUOTA_DIRTY = True
+        return QUOTA_CACHE["api_requests"]
 
 
 def decrement_api_requests(count):
     """Decrements API request counter by count (for rollback on errors)."""
-    api_requests, uploaded_bytes = load_daily_quota()
-    api_requests = max(0, api_requests - count)  # Don't go below 0
-    quota_data = {
-        "date": get_current_pst_date().isoformat(),
-        "api_requests": api_requests,
-        "uploaded_bytes": uploaded_bytes,
-    }
-    save_daily_quota(quota_data)
-    return api_requests
+    global QUOTA_DIRTY
+    with STATE_LOCK:
+        load_daily_quota()
+        # Don't go below 0
+        QUOTA_CACHE["api_requests"] = max(0, QUOTA_CACHE["api_requests"] - count)
+        QUOTA_DIRTY = True
+        return QUOTA_CACHE["api_requests"]
+
+
+def learn_requests_per_file(api_requests):
+    """Updates per-album requests/file averages from the Monitoring API delta.
+
+    Requests counted since the previous sync are spread over the files
+    uploaded in between, and the sample is applied to every album that
+    uploaded in that window (EMA, so the 2-15 min metric delay averages out).
+    A window whose uploads don't show up in the metric yet is kept open
+    (a 0 sample would make uploads look free), and albums without stats
+    start from the mean of all albums instead of a single sample.
+    """
+    global LAST_API_REQUESTS, REQUESTS_STATS_DIRTY, REQUESTS_HISTORY_SUM
+    with STATE_LOCK:
+        if LAST_API_REQUESTS is None or api_requests < LAST_API_REQUESTS:
+            # First sync of the run or a new quota day
+            LAST_API_REQUESTS = api_requests
+            WINDOW_UPLOADS.clear()
+            return
+        files = sum(WINDOW_UPLOADS.values())
+        if not files or api_requests == LAST_API_REQUESTS:
+            # Keep the baseline, late requests belong to the next window
+            return
+        sample = (api_requests - LAST_API_REQUESTS) / files
+        mean = REQUESTS_HISTORY_SUM / len(REQUESTS_HISTORY) if REQUESTS_HISTORY else REQUESTS_PER_FILE_DEFAULT
+        # Running sum, so the rolling mean stays O(1)
+        if len(REQUESTS_HISTORY) == REQUESTS_HISTORY_SIZE:
+            REQUESTS_HISTORY_SUM -= REQUESTS_HISTORY[0]
+        REQUESTS_HISTORY.append(sample)
+        REQUESTS_HISTORY_SUM += sample
+        for album, count in WINDOW_UPLOADS.items():
+            ema, total = REQUESTS_STATS.get(album, (mean, 0))
+            ema = REQUESTS_EMA_ALPHA * sample + (1 - REQUESTS_EMA_ALPHA) * ema
+            REQUESTS_STATS[album] = [round(ema, 3), total + count]
+        REQUESTS_STATS_DIRTY = True
+        LAST_API_REQUESTS = api_requests
+        WINDOW_UPLOADS.clear()
+
+
+def requests_per_file(album):
+    """Returns expected API requests per file uploaded to album.
+
+    Albums without stats yet use the mean of recent samples from all albums.
+    """
+    stats = REQUESTS_STATS.get(album)
+    if stats is not None:
+        return stats[0]
+    if REQUESTS_HISTORY:
+        return REQUESTS_HISTORY_SUM / len(REQUESTS_HISTORY)
+    return REQUESTS_PER_FILE_DEFAULT
+
+
+def estimate_requests(album, files):
+    """Returns expected API requests for uploading files to album."""
+    return round(requests_per_file(album) * files)
+
+
+def files_within_quota(album, files):
+    """Returns how many of files can be uploaded to album before STOP_LIMIT.
+
+    0 means not even one file fits; the quota check in run_cmd then stops the run.
+    """
+    api_requests, _ = load_daily_quota()
+    left = STOP_LIMIT - api_requests
+    if left <= 0:
+        return 0
+    per_file = requests_per_file(album)
+    fitting = min(files, int(left / per_file)) if per_file > 0 else files
+    # Same projection as check_api_quota: api_requests + estimate < STOP_LIMIT
+    while fitting > 0 and estimate_requests(album, fitting) >= left:
+        fitting -= 1
+    return fitting
+
+
+def record_album_uploads(album, files):
+    """Counts uploaded files towards the learning window and the local counter.
+
+    The estimate keeps the counter moving between Monitoring API syncs
+    (and without them); the next sync replaces it with the real value.
+    """
+    global QUOTA_DIRTY
+    with STATE_LOCK:
+        WINDOW_UPLOADS[album] += files
+        load_daily_quota()
+        QUOTA_CACHE["api_requests"] += estimate_requests(album, files)
+        QUOTA_DIRTY = True
+
+
+def save_requests_stats():
+    """Writes REQUESTS_STATS to disk if changed."""
+    global REQUESTS_STATS_DIRTY
+    with STATE_LOCK:
+        if REQUESTS_STATS_DIRTY:
+            write_file_atomic(
+                REQUESTS_STATS_FILE,
+                json_dumps({"albums": REQUESTS_STATS, "recent": list(REQUESTS_HISTORY)}),
+            )
+            REQUESTS_STATS_DIRTY = False
 
 
 def increment_upload_bytes(bytes_count):
-    """Increments uploaded bytes counter and saves."""
-    api_requests, uploaded_bytes = load_daily_quota()
-    uploaded_bytes += bytes_count
-    quota_data = {
-        "date": get_current_pst_date().isoformat(),
-        "api_requests": api_requests,
-        "uploaded_bytes": uploaded_bytes,
-    }
-    save_daily_quota(quota_data)
-    return uploaded_bytes
+    """Increments uploaded bytes counter."""
+    global QUOTA_DIRTY
+    with STATE_LOCK:
+        load_daily_quota()
+        QUOTA_CACHE["uploaded_bytes"] += bytes_count
+        QUOTA_DIRTY = True
+        return QUOTA_CACHE["uploaded_bytes"]
 
 
 def check_api_quota(requests_needed=1):
@@ -532,34 +1031,40 @@ def check_api_quota(requests_needed=1):
         requests_needed: Number of requests planned to make (for projection only)
     """
     api_requests, _ = load_daily_quota()
+    flush_daily_quota()
+    projected_requests = api_requests + requests_needed  # For projection only
+    # Fast path: well below every threshold, nothing to log
+    if projected_requests < WARNING_LIMIT:
+        return True
+
     # Calculate percentage from ACTUAL usage, not projected
     percentage = api_requests / API_QUOTA_LIMIT
-    effective_limit = API_QUOTA_LIMIT - SAFETY_RESERVE  # Account for reserve
-    stop_threshold_limit = int(API_QUOTA_LIMIT * STOP_THRESHOLD)  # 95% = 9500
-    projected_requests = api_requests + requests_needed  # For projection only
 
     # Check STOP_THRESHOLD first (95% = 9500 requests) - based on actual usage
-    if api_requests >= stop_threshold_limit:
+    if api_requests >= STOP_LIMIT:
         log(
             f"STOP_THRESHOLD ({STOP_THRESHOLD*100:.0f}%) reached: {api_requests}/{API_QUOTA_LIMIT} ({percentage*100:.1f}%)"
         )
         log(f"Stopping work to prevent quota overrun")
+        flush_daily_quota(force=True)
         return False
 
-    # Check effective_limit (with safety reserve) - based on actual usage
-    if api_requests >= effective_limit:
+    # Check EFFECTIVE_LIMIT (with safety reserve) - based on actual usage
+    if api_requests >= EFFECTIVE_LIMIT:
         log(
             f"Safe API request limit exceeded: {api_requests}/{API_QUOTA_LIMIT} (reserve: {SAFETY_RESERVE} requests)"
         )
         log(f"Stopping work to prevent quota overrun")
+        flush_daily_quota(force=True)
         return False
 
     # Check projected limit (for planning future operations)
-    if projected_requests >= stop_threshold_limit:
+    if projected_requests >= STOP_LIMIT:
         log(
             f"Projected requests would exceed STOP_THRESHOLD: {api_requests}/{API_QUOTA_LIMIT} → {projected_requests} after operation"
         )
         log(f"Stopping work to prevent quota overrun")
+        flush_daily_quota(force=True)
         return False
 
     # Warning and critical levels based on ACTUAL usage
@@ -586,6 +1091,9 @@ def check_upload_quota(file_size):
     """Checks upload volume limit, returns True if file can be uploaded."""
     _, uploaded_bytes = load_daily_quota()
     new_total = uploaded_bytes + file_size
+    # Fast path: well below every threshold, nothing to log
+    if new_total < UPLOAD_WARNING_LIMIT:
+        return True
     percentage = new_total / UPLOAD_QUOTA_LIMIT
 
     if percentage >= STOP_THRESHOLD:
@@ -595,6 +1103,7 @@ def check_upload_quota(file_size):
             f"Upload volume limit reached: {uploaded_mb:.1f}/{limit_mb:.1f} MB ({percentage*100:.1f}%)"
         )
         log(f"Stopping work to prevent quota overrun")
+        flush_daily_quota(force=True)
         return False
 
     if percentage >= CRITICAL_THRESHOLD:
@@ -625,17 +1134,241 @@ def is_nonrecoverable_media_error(message: str) -> bool:
     if not message:
         return False
     # Normalize quotes to handle both regular and typographic quotes
-    # Replace typographic quotes (U+2019) with regular apostrophe (U+0027)
-    msg_normalized = message.lower().replace("\u2019", "'").replace("\u2018", "'")
-    known_patterns = [
-        "error while trying to create this media item",
-        "upload failed: failed: there was an error while trying to create this media item",
-        "it may be damaged or use a file format that preview doesn't recognize",
+    return NONRECOVERABLE_RE.search(message.translate(APOSTROPHES)) is not None
+
+
+# rclone rc method call, run by run_cmd like a command line
+RcCall = namedtuple("RcCall", "method params")
+RC_LOCAL = threading.local()  # One keep-alive HTTP connection per thread
+RC_GROUP_IDS = itertools.count(1)
+RCD_PROCESS = None
+
+
+def rclone_upload_flags(transfers):
+    """Returns rclone flags shared by 'rclone copy' and 'rclone rcd'."""
+    flags = [
+        "--checkers",
+        "8",
+        "--transfers",
+        str(transfers),
+        "--timeout",
+        f"{UPLOAD_TIMEOUT}s",
+        "--low-level-retries",
+        "5",
     ]
-    return any(pattern in msg_normalized for pattern in known_patterns)
+    if UPLOAD_BWLIMIT:
+        flags += ["--bwlimit", UPLOAD_BWLIMIT]
+    if GPHOTOS_BATCH_MODE:
+        flags += ["--gphotos-batch-mode", GPHOTOS_BATCH_MODE]
+    if GPHOTOS_BATCH_SIZE:
+        flags += ["--gphotos-batch-size", GPHOTOS_BATCH_SIZE]
+    return flags
+
+
+def rc_call(method, params=None, timeout=None):
+    """Calls an rclone rcd method over HTTP.
+
+    Returns:
+        tuple: (HTTP status, decoded JSON response)
+    """
+    body = json_dumps(params or {})
+    for attempt in range(2):
+        conn = getattr(RC_LOCAL, "conn", None)
+        reused = conn is not None
+        if conn is None:
+            host, port = RCLONE_RC_ADDR.rsplit(":", 1)
+            conn = RC_LOCAL.conn = http.client.HTTPConnection(host, int(port))
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            conn.request("POST", "/" + method, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            RC_LOCAL.conn = None
+            # Idle keep-alive connection closed by rcd - the request never ran
+            stale = isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError))
+            if reused and stale and attempt == 0:
+                continue
+            raise
+        return response.status, json_loads(data) if data else {}
 
 
-def run_cmd(cmd, retries=3, cooldown=5, is_gphotos_api=False, estimated_requests=1):
+def run_rc(call):
+    """Runs an RcCall, returns (returncode, stdout, stderr) like a subprocess.
+
+    The call gets its own stats group, and the files it transferred are
+    reported as rclone JSON log lines, so stderr can be parsed the same way
+    as the output of 'rclone copy --use-json-log'.
+    """
+    group = f"gphoto-{next(RC_GROUP_IDS)}"
+    try:
+        status, response = rc_call(call.method, dict(call.params, _group=group))
+    except (OSError, http.client.HTTPException) as e:
+        return 1, "", f"rclone rc {call.method} failed: {e}"
+
+    lines = []
+    try:
+        _, stats = rc_call("core/transferred", {"group": group}, timeout=30)
+        for transfer in stats.get("transferred") or []:
+            if transfer.get("error"):
+                entry = {"level": "error", "msg": transfer["error"], "object": transfer.get("name")}
+            elif not transfer.get("checked"):
+                entry = {"level": "info", "msg": "Copied (new)", "object": transfer.get("name")}
+            else:
+                continue
+            lines.append(json_dumps(entry).decode("utf-8"))
+        rc_call("core/stats-delete", {"group": group}, timeout=30)
+    except (OSError, http.client.HTTPException) as e:
+        lines.append(f"rclone rc core/transferred failed: {e}")
+
+    if status != 200:
+        lines.append(response.get("error") or f"rclone rc {call.method} returned HTTP {status}")
+        return 1, "", "\n".join(lines)
+    return 0, json_dumps(response).decode("utf-8"), "\n".join(lines)
+
+
+def start_rclone_rcd():
+    """Starts the rclone rcd daemon used for RcCall commands.
+
+    Returns:
+        bool: True if the daemon answers, False if it could not be started
+    """
+    global RCD_PROCESS
+    rcd_log = open(Path(LOG_DIR) / "rclone_rcd.log", "a", encoding="utf-8")
+    try:
+        RCD_PROCESS = subprocess.Popen(
+            ["rclone", "rcd", "--rc-addr", RCLONE_RC_ADDR, "--rc-no-auth", *rclone_upload_flags(TRANSFER_TUNER.transfers)],
+            executable=RCLONE_BIN,
+            stdout=rcd_log,
+            stderr=subprocess.STDOUT,
+        )
+    except OSError as e:
+        log(f"Warning: Could not start rclone rcd: {e}")
+        return False
+    finally:
+        rcd_log.close()
+    atexit.register(stop_rclone_rcd)
+
+    deadline = time.monotonic() + 30
+    while RCD_PROCESS.poll() is None and time.monotonic() < deadline:
+        try:
+            if rc_call("rc/noop", timeout=5)[0] == 200:
+                log(f"rclone rcd listening on {RCLONE_RC_ADDR}")
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    log(f"Warning: rclone rcd did not start on {RCLONE_RC_ADDR} (see rclone_rcd.log)")
+    stop_rclone_rcd()
+    return False
+
+
+RUNNING_PROCS = set()  # rclone processes started by run_process
+RUNNING_PROCS_LOCK = threading.Lock()
+
+
+def stop_uploads():
+    """Stops running rclone processes (Ctrl-C); run_cmd then raises KeyboardInterrupt."""
+    STOP_EVENT.set()
+    with RUNNING_PROCS_LOCK:
+        for proc in RUNNING_PROCS:
+            if proc.poll() is None:
+                proc.terminate()
+    # rc calls in flight fail once the daemon is gone
+    stop_rclone_rcd()
+
+
+def stop_rclone_rcd():
+    """Stops the rclone rcd daemon if it is running."""
+    if RCD_PROCESS is not None and RCD_PROCESS.poll() is None:
+        RCD_PROCESS.terminate()
+        try:
+            RCD_PROCESS.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            RCD_PROCESS.kill()
+
+
+def run_process(cmd, on_stderr=None, parse_stdout=None, capture_stdout=True):
+    """Runs an rclone command line, returns (returncode, stdout, stderr).
+
+    stderr is read line by line while rclone runs: lines are passed to
+    on_stderr as they arrive, and rclone is stopped as soon as it reports the
+    daily quota limit instead of retrying against it.
+    parse_stdout, if given, is called with the stdout line iterator while
+    rclone runs and its result is returned instead of the stdout text.
+    With capture_stdout=False stdout is discarded and "" is returned.
+    """
+    # Full executable path and close_fds=False let CPython use posix_spawn();
+    # files opened by Python are non-inheritable anyway (PEP 446)
+    proc = subprocess.Popen(
+        cmd,
+        executable=RCLONE_BIN,
+        stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        close_fds=False,
+    )
+    with RUNNING_PROCS_LOCK:
+        RUNNING_PROCS.add(proc)
+        if STOP_EVENT.is_set():
+            proc.terminate()  # Started while stop_uploads() ran
+    stdout_parts = []
+    reader_errors = []
+
+    def read_stdout():
+        try:
+            stdout_parts.append(proc.stdout.read() if parse_stdout is None else parse_stdout(proc.stdout))
+        except Exception as error:
+            reader_errors.append(error)
+
+    reader = None
+    if capture_stdout:
+        # Drain stdout in parallel so a full pipe can't block rclone
+        reader = threading.Thread(target=read_stdout, daemon=True)
+        reader.start()
+    stderr_lines = []
+    try:
+        for line in proc.stderr:
+            stderr_lines.append(line)
+            if on_stderr is not None:
+                on_stderr(line)
+            if is_daily_quota_exceeded(line):
+                proc.terminate()
+                break
+    finally:
+        if proc.poll() is None and sys.exc_info()[0] is not None:
+            proc.kill()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if reader is not None:
+            reader.join()  # rclone has exited, stdout is at EOF
+            proc.stdout.close()
+        proc.stderr.close()
+        with RUNNING_PROCS_LOCK:
+            RUNNING_PROCS.discard(proc)
+    if reader is not None and not stdout_parts:
+        # An empty listing here would be cached as if the remote were empty
+        raise RuntimeError("rclone stdout could not be read") from (reader_errors[0] if reader_errors else None)
+    return proc.returncode, stdout_parts[0] if stdout_parts else "", "".join(stderr_lines)
+
+
+def run_cmd(
+    cmd,
+    retries=3,
+    cooldown=5,
+    is_gphotos_api=False,
+    estimated_requests=1,
+    on_stderr=None,
+    parse_stdout=None,
+    capture_stdout=True,
+):
     """Safe rclone call with 429/Quota exceeded handling.
     
     Uses real value from Google Cloud Monitoring API.
@@ -643,59 +1376,56 @@ def run_cmd(cmd, retries=3, cooldown=5, is_gphotos_api=False, estimated_requests
     On errors (except quota errors), does NOT count requests (they weren't successful).
 
     Args:
-        estimated_requests: Legacy parameter, kept for API compatibility (not used)
+        estimated_requests: Requests the command is expected to make, used to
+            check that it fits into the quota before it starts
+        on_stderr: Optional callback called with stderr of every attempt
+            (successful or not), before errors are classified; rclone
+            command lines pass it line by line while they run
+        parse_stdout: Optional parser of stdout lines of rclone command lines
+            (see run_process), its result replaces stdout
+        capture_stdout: False discards stdout of rclone command lines
+            (uploads only need stderr)
     Returns:
         tuple: (stdout, 0)
+
+    cmd is an argument list for the rclone binary or an RcCall, which is sent
+    to the rclone rcd daemon (see start_rclone_rcd).
     """
-    global LAST_SYNC_TIME, LAST_SYNC_UPLOADS
+    global LAST_SYNC_UPLOADS
     
     if is_gphotos_api:
-        # Sync with API before check (periodically)
-        current_time = time.time()
-        should_sync = False
-        
-        if LAST_SYNC_TIME is None:
-            # First sync
-            should_sync = True
-        elif (current_time - LAST_SYNC_TIME) >= SYNC_INTERVAL_SECONDS:
-            # Enough time passed
-            should_sync = True
-        elif (LAST_SYNC_UPLOADS + 1) >= SYNC_INTERVAL_UPLOADS:
-            # Enough uploads passed
-            should_sync = True
-        
-        if should_sync:
-            if sync_quota_from_api():
-                LAST_SYNC_TIME = current_time
-                LAST_SYNC_UPLOADS = 0
+        # Sync with API in the background (periodically)
+        request_quota_sync()
         
-        # Check quota before operation (use real value from Monitoring API)
-        if not check_api_quota(0):  # 0 because real value is already in counter
+        # Check quota before operation (counter holds real value from Monitoring API)
+        if not check_api_quota(estimated_requests):
             reset_time, seconds_until_reset = get_quota_reset_time()
             raise QuotaExceededError(reset_time, seconds_until_reset)
 
     last_error = None
     for attempt in range(1, retries + 1):
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        if STOP_EVENT.is_set():
+            raise KeyboardInterrupt
+        if isinstance(cmd, RcCall):
+            returncode, stdout, stderr = run_rc(cmd)
+            if on_stderr is not None:
+                on_stderr(stderr)
+        else:
+            returncode, stdout, stderr = run_process(cmd, on_stderr, parse_stdout, capture_stdout)
 
-        if result.returncode == 0:
+        if returncode == 0:
             # SUCCESS - do NOT increment counter, it's updated via API sync
             if is_gphotos_api:
                 # Increment upload counter for periodic sync
                 LAST_SYNC_UPLOADS += 1
-                
-                # Periodic sync after successful operation
-                current_time = time.time()
-                if (LAST_SYNC_TIME is None or 
-                    (current_time - LAST_SYNC_TIME) >= SYNC_INTERVAL_SECONDS or
-                    LAST_SYNC_UPLOADS >= SYNC_INTERVAL_UPLOADS):
-                    if sync_quota_from_api():
-                        LAST_SYNC_TIME = current_time
-                        LAST_SYNC_UPLOADS = 0
+                request_quota_sync()
             
-            return result.stdout.strip(), 0
+            return (stdout.strip() if isinstance(stdout, str) else stdout), 0
+
+        if STOP_EVENT.is_set():
+            # rclone was stopped by stop_uploads(), not a failure to retry
+            raise KeyboardInterrupt
 
-        stderr = result.stderr
         last_error = stderr
 
         # Check for daily quota limit
@@ -716,10 +1446,9 @@ def run_cmd(cmd, retries=3, cooldown=5, is_gphotos_api=False, estimated_requests
                 f"Wait time remaining: {hours_until_reset:.1f} hours ({seconds_until_reset // 60} minutes)"
             )
             log(f"Saving state to continue after quota reset...")
+            flush_daily_quota(force=True)
             raise QuotaExceededError(reset_time, seconds_until_reset)
 
-        stderr_lower = stderr.lower()
-
         # Check for non-recoverable media errors (damaged/unsupported files)
         if is_nonrecoverable_media_error(stderr):
             log(f"Non-recoverable media error detected, stopping retries")
@@ -733,161 +1462,577 @@ def run_cmd(cmd, retries=3, cooldown=5, is_gphotos_api=False, estimated_requests
                 raise QuotaExceededError(reset_time, seconds_until_reset)
 
         # Detect temporary quota errors (rate limit)
-        if (
-            "quota exceeded" in stderr_lower
-            or "too many requests" in stderr_lower
-            or "rate limit" in stderr_lower
-        ):
+        if RATE_LIMIT_RE.search(stderr):
+            if is_gphotos_api:
+                UPLOAD_LIMITER.rate_limited()
+                TRANSFER_TUNER.rate_limited()
             wait = cooldown * attempt * 2
             log(
                 f"Warning: Temporary rate limit — pausing {wait} sec before retry (attempt {attempt}/{retries})"
             )
-            time.sleep(wait)
+            if STOP_EVENT.wait(wait):
+                raise KeyboardInterrupt
             continue
 
         # If error is different — just retry
-        log(f"Warning: Error: {stderr.strip()} (attempt {attempt}/{retries})")
-        time.sleep(cooldown * attempt)
+        log(f"Warning: Error: {format_rclone_error(stderr)} (attempt {attempt}/{retries})")
+        if STOP_EVENT.wait(cooldown * attempt):
+            raise KeyboardInterrupt
 
     # All retries failed - don't count requests (operation didn't succeed)
     raise RuntimeError(last_error or "rclone error")
 
 
-def list_drive_files():
-    """List all photos/videos in Google Drive. Returns list of tuples (path, size)."""
-    cmd = ["rclone", "lsjson", f"{GDRIVE}:{SOURCE_PATH}", "--recursive", "--files-only"]
+def load_listing_cache():
+    """Returns cached Drive listing [(path, size), ...] or None if missing/expired."""
+    if LISTING_CACHE_TTL <= 0 or not LISTING_CACHE_FILE.exists():
+        return None
     try:
-        out, _ = run_cmd(cmd, is_gphotos_api=False)  # Request to Google Drive, don't count
-        data = json.loads(out)
-    except Exception as e:
-        log(f"Error getting file list: {e}")
-        return []
+        cache = json_loads(LISTING_CACHE_FILE.read_bytes())
+    except Exception:
+        return None
+    if cache.get("source") != f"{GDRIVE}:{SOURCE_PATH}":
+        return None
+    age = time.time() - cache.get("timestamp", 0)
+    if not 0 <= age < LISTING_CACHE_TTL:
+        return None
+    log(f"Using cached Drive listing ({age / 60:.0f} min old, set LISTING_CACHE_TTL=0 to disable)")
+    return [(name, size) for name, size in cache["files"]]
+
+
+def save_listing_cache(files):
+    """Saves Drive listing for re-runs within LISTING_CACHE_TTL."""
+    if LISTING_CACHE_TTL <= 0:
+        return
+    cache = {
+        "source": f"{GDRIVE}:{SOURCE_PATH}",
+        "timestamp": time.time(),
+        "files": files,
+    }
+    write_file_atomic(LISTING_CACHE_FILE, json_dumps(cache))
 
-    files = []
-    for f in data:
-        name = f["Path"]
-        size = f.get("Size", 0)
-        if size == 0 or name.lower().endswith(IGNORED_EXT):
-            continue
-        files.append((name, size))
-    return files
+
+def file_ext(path):
+    """Returns the lowercased extension of path ("" if none), like os.path.splitext.
+
+    Only the extension is lowercased, not the whole path.
+    """
+    dot = path.rfind(".")
+    # No dot in the file name, or only a leading one (".hidden")
+    if dot <= path.rfind("/") + 1:
+        return ""
+    return path[dot:].lower()
+
+
+def rclone_list(remote, recursive=False, files_only=False, dirs_only=False, fast_list=False, **kwargs):
+    """Lists remote with rclone. Returns list of tuples (path, size).
+
+    Uses 'rclone lsf' with path;size lines, which is much less output to
+    buffer and parse than 'rclone lsjson' on large libraries, or
+    operations/list on the rclone rcd daemon in RCLONE_RC mode.
+    Directory paths have no trailing slash. kwargs are passed to run_cmd.
+    """
+    if RCLONE_RC:
+        cmd = RcCall(
+            "operations/list",
+            {
+                "fs": remote,
+                "remote": "",
+                "opt": {
+                    "recurse": recursive,
+                    "filesOnly": files_only,
+                    "dirsOnly": dirs_only,
+                    "noModTime": True,
+                    "noMimeType": True,
+                },
+                "_config": {"UseListR": fast_list},
+            },
+        )
+        out, _ = run_cmd(cmd, **kwargs)
+        return [(item["Path"], item["Size"]) for item in json_loads(out)["list"]]
+
+    cmd = ["rclone", "lsf", remote, "--format", "ps"]
+    if recursive:
+        cmd.append("--recursive")
+    if files_only:
+        cmd.append("--files-only")
+    if dirs_only:
+        cmd.append("--dirs-only")
+    if fast_list:
+        cmd.append("--fast-list")
+
+    def parse_lines(lines):
+        """Parses path;size lines as rclone prints them, without buffering the output."""
+        entries = []
+        for line in lines:
+            # Size is the last field, path itself may contain the separator
+            name, _, size = line.rstrip("\n").rpartition(";")
+            try:
+                entries.append((name.rstrip("/"), int(size)))
+            except ValueError:
+                continue
+        return entries
+
+    entries, _ = run_cmd(cmd, parse_stdout=parse_lines, **kwargs)
+    return entries
+
+
+def list_drive_files():
+    """List all photos/videos in Google Drive. Returns list of tuples (path, size).
+
+    Empty files and files of other kinds (see EXT_KIND) are left out. The
+    listing is cached in LISTING_CACHE_FILE (see LISTING_CACHE_TTL).
+    """
+    files = load_listing_cache()
+    if files is None:
+        root = f"{GDRIVE}:{SOURCE_PATH}"
+
+        def list_shard(folder):
+            """Lists one top-level folder recursively, paths relative to root."""
+            shard = rclone_list(
+                f"{root}/{folder}",
+                recursive=True,
+                files_only=True,
+                fast_list=True,
+                is_gphotos_api=False,  # Request to Google Drive, don't count
+            )
+            return [(f"{folder}/{name}", size) for name, size in shard]
+
+        try:
+            # Files in the root itself, then top-level folders listed in parallel
+            files = rclone_list(root, files_only=True, is_gphotos_api=False)
+            folders = [name for name, _ in rclone_list(root, dirs_only=True, is_gphotos_api=False)]
+            with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as executor:
+                try:
+                    for shard in executor.map(list_shard, folders):
+                        files.extend(shard)
+                except KeyboardInterrupt:
+                    # Stop the other shards instead of waiting out their retries
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    stop_uploads()
+                    raise
+        except Exception as e:
+            # Don't cache a partial listing
+            log(f"Error getting file list: {e}")
+            return []
+        save_listing_cache(files)
+
+    return [
+        (name, size)
+        for name, size in files
+        # Only photos and videos, so nothing else reaches the upload loop
+        if size != 0 and EXT_KIND.get(file_ext(name), "ignore") != "ignore"
+    ]
 
 
 def detect_from_name(name):
     """Extracts YYYY_MM from filename."""
-    m = re.search(r"(19|20\d{2})[-_.]?(0[1-9]|1[0-2])", name)
+    m = DATE_RE.search(name)
     return f"{m.group(1)}_{m.group(2)}" if m else "unsorted"
 
 
 def infer_album(relpath, is_video):
     base = detect_from_name(relpath)
     suffix = "video" if is_video else "photo"
-    album = f"{base}_{suffix}"
-    METRICS["albums_created"].add(album)
-    return album
+    return f"{base}_{suffix}"
 
 
 def ensure_album(album_name):
     """Tracks album usage for request optimization."""
-    if album_name not in KNOWN_ALBUMS:
-        KNOWN_ALBUMS.add(album_name)
-        log(
-            f"Album {album_name} → will be created on first upload (if doesn't exist)"
-        )
-        return True  # First use of album
-    return False  # Album already used
+    with STATE_LOCK:
+        if album_name not in KNOWN_ALBUMS:
+            KNOWN_ALBUMS.add(album_name)
+            log(
+                f"Album {album_name} → will be created on first upload (if doesn't exist)"
+            )
+            return True  # First use of album
+        return False  # Album already used
 
 
-def upload_file(relpath, album, file_size):
-    """Uploads file from GDrive → GPhotos.
-    
-    Uses real quota value from Google Cloud Monitoring API.
-    """
-    # Check upload volume quota before upload
-    if not check_upload_quota(file_size):
-        reset_time, seconds_until_reset = get_quota_reset_time()
-        raise QuotaExceededError(reset_time, seconds_until_reset)
+REMOTE_ALBUMS = None  # Album names on Google Photos, listed once per run
+ALBUM_FILES = {}  # album → names of files in it (None if it couldn't be listed)
+ALBUM_LIST_LOCK = threading.Lock()
 
-    src = f"{GDRIVE}:{SOURCE_PATH}/{relpath}"
-    dest = f"{GPHOTOS}:album/{album}/"  # ← added 'album/'
 
-    # Determine if this is the first file in album
-    is_first_in_album = ensure_album(album)
+def list_remote_albums():
+    """Returns names of existing Google Photos albums, or None if unknown."""
+    global REMOTE_ALBUMS
+    with ALBUM_LIST_LOCK:
+        if REMOTE_ALBUMS is None:
+            try:
+                albums = rclone_list(f"{GPHOTOS}:album", dirs_only=True, retries=2, is_gphotos_api=True)
+            except QuotaExceededError:
+                raise
+            except Exception as e:
+                log(f"Warning: Could not list albums: {format_rclone_error(str(e))}")
+                return None
+            REMOTE_ALBUMS = {name for name, _ in albums}
+        return REMOTE_ALBUMS
 
-    cmd = [
-        "rclone",
-        "copy",
-        src,
-        dest,
-        "--checkers",
-        "8",
-        "--transfers",
-        str(MAX_PARALLEL_UPLOADS),
-        "--timeout",
-        f"{UPLOAD_TIMEOUT}s",
-        "--low-level-retries",
-        "5",
-        "--retries",
-        "3",
-        "--bwlimit",
-        "2M",
-        "--quiet",
-    ]
 
+def list_album_files(album):
+    """Returns names of files already in a Google Photos album, or None if unknown.
+
+    Each album is listed once per run, so files that are already there (lost
+    state.json, uploads from another machine) are skipped without an upload
+    attempt, and rclone doesn't have to list the album again for every batch.
+    """
+    albums = list_remote_albums()
+    if albums is None:
+        return None
+    if album not in albums:
+        return set()  # Will be created by the first upload
+    with ALBUM_LIST_LOCK:
+        if album in ALBUM_FILES:
+            return ALBUM_FILES[album]
+    # Listed without the lock, so other albums' uploads don't wait for it;
+    # only this album's upload thread asks for it (see upload_album)
     try:
-        _ = run_cmd(
-            cmd,
-            retries=5,
-            cooldown=30,
-            is_gphotos_api=True,
-            estimated_requests=1,  # Legacy parameter, kept for compatibility
-        )
-        # Increment uploaded bytes counter after successful upload
-        increment_upload_bytes(file_size)
-        DONE.add(relpath)
-        with open(STATE_FILE, "w") as state_file:
-            json.dump(list(DONE), state_file)
-        METRICS["uploaded_files"] += 1
-        METRICS["by_album"][album] += 1
-        log(f"✓ Success: {relpath} → {album}")
+        files = rclone_list(f"{GPHOTOS}:album/{album}", files_only=True, retries=2, is_gphotos_api=True)
+        names = {name for name, _ in files}
     except QuotaExceededError:
-        # Re-raise QuotaExceededError to stop the loop
         raise
     except Exception as e:
-        METRICS["errors"] += 1
-        log(f"Error uploading {relpath}: {e}")
-        error_message = str(e)
-        if is_nonrecoverable_media_error(error_message):
-            reason = (
-                "Google Photos rejected the media item as damaged or unsupported. "
-                "Re-encode or inspect the original file before retrying."
-            )
-            FAILED[relpath] = {
-                "reason": reason,
-                "timestamp": datetime.now().isoformat(),
-            }
-            METRICS["failed_files"][relpath] = FAILED[relpath]
-            with open(FAILED_FILE, "w") as failed_file:
-                json.dump(FAILED, failed_file, indent=2, ensure_ascii=False)
-            DONE.add(relpath)
-            with open(STATE_FILE, "w") as state_file:
-                json.dump(list(DONE), state_file)
-            log(f"Skipping {relpath}: {reason}")
+        log(f"Warning: Could not list album {album}: {format_rclone_error(str(e))}")
+        names = None
+    with ALBUM_LIST_LOCK:
+        ALBUM_FILES[album] = names
+    return names
+
+
+def parse_rclone_json_log(stderr):
+    """Yields log entries (dicts) from rclone --use-json-log output."""
+    for line in stderr.splitlines():
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            yield json_loads(line)
+        except ValueError:
+            continue
+
+
+def format_rclone_error(stderr):
+    """Returns error messages from rclone output, skipping JSON info lines."""
+    errors = [
+        f"{entry['object']}: {entry.get('msg', '')}" if entry.get("object") else entry.get("msg", "")
+        for entry in parse_rclone_json_log(stderr)
+        if entry.get("level") in ("error", "critical")
+    ]
+    if errors:
+        return "; ".join(errors)
+    return "\n".join(
+        line for line in stderr.strip().splitlines() if not line.lstrip().startswith("{")
+    )
+
+
+def mark_failed(relpath, reason):
+    """Remembers file as permanently failed so it is skipped on next runs."""
+    global FAILED_WAL_ENTRIES
+    with STATE_LOCK:
+        FAILED[relpath] = {
+            "reason": reason,
+            "timestamp": datetime.now().isoformat(),
+        }
+        METRICS["failed_files"][relpath] = FAILED[relpath]
+        # Failures are rare, make each one durable right away
+        FAILED_WAL_FH.write(json_dumps({"path": relpath, **FAILED[relpath]}) + b"\n")
+        FAILED_WAL_FH.flush()
+        os.fsync(FAILED_WAL_FH.fileno())
+        FAILED_WAL_ENTRIES += 1
+        record_done(relpath)
+        log(f"Skipping {relpath}: {reason}")
+
+
+def record_done(relpath):
+    """Adds file to DONE and appends it to the state WAL."""
+    global WAL_UNSYNCED, WAL_ENTRIES
+    with STATE_LOCK:
+        if relpath in DONE:
+            return
+        DONE.add(relpath)
+        STATE_WAL_FH.write(relpath + "\n")
+        WAL_UNSYNCED += 1
+        WAL_ENTRIES += 1
+        if WAL_ENTRIES >= STATE_SNAPSHOT_EVERY:
+            snapshot_state()
+        elif WAL_UNSYNCED >= STATE_WAL_FSYNC_EVERY:
+            flush_state_wal()
+
+
+def flush_state_wal():
+    """Makes WAL entries durable."""
+    global WAL_UNSYNCED
+    with STATE_LOCK:
+        if WAL_UNSYNCED == 0:
+            return
+        STATE_WAL_FH.flush()
+        os.fsync(STATE_WAL_FH.fileno())
+        WAL_UNSYNCED = 0
+
+
+def write_file_atomic(path, data):
+    """Writes bytes to path via temporary file + rename, so path is never left truncated."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def snapshot_state():
+    """Writes DONE to state.json and FAILED to failed.json, truncates their WALs."""
+    global WAL_UNSYNCED, WAL_ENTRIES, FAILED_WAL_ENTRIES
+    with STATE_LOCK:
+        # WAL entries are only dropped once the snapshot is on disk
+        write_file_atomic(STATE_FILE, json_dumps(list(DONE)))
+        STATE_WAL_FH.flush()
+        STATE_WAL_FH.truncate(0)
+        WAL_UNSYNCED = 0
+        WAL_ENTRIES = 0
+        if FAILED_WAL_ENTRIES:
+            write_file_atomic(FAILED_FILE, json_dumps(FAILED, indent=True))
+            FAILED_WAL_FH.truncate(0)
+            FAILED_WAL_ENTRIES = 0
+        save_requests_stats()
+
+
+def checkpoint_state():
+    """Snapshots state at interpreter exit, also after unexpected errors."""
+    with STATE_LOCK:
+        if WAL_ENTRIES or FAILED_WAL_ENTRIES:
+            snapshot_state()
+        else:
+            flush_state_wal()
+            save_requests_stats()
+
+
+# Registered after close_log, so it runs before the log is closed
+atexit.register(checkpoint_state)
+
+
+def record_uploaded(album, uploaded):
+    """Records (relpath, size) files copied to album, all under one STATE_LOCK hold.
+
+    Marks them done, counts them in METRICS and adds their bytes and estimated
+    requests to the daily quota counters.
+    """
+    with STATE_LOCK:
+        for relpath, _ in uploaded:
+            record_done(relpath)
+        METRICS["uploaded_files"] += len(uploaded)
+        METRICS["by_album"][album] += len(uploaded)
+        increment_upload_bytes(sum(size for _, size in uploaded))
+        record_album_uploads(album, len(uploaded))
+
+
+def upload_batch(album, folder, entries):
+    """Uploads a batch of files from one GDrive folder → one GPhotos album.
+
+    All files are copied by a single rclone invocation (--files-from-raw), so
+    process startup, token refresh and album lookup are paid once per batch.
+    Files are grouped by folder because rclone keeps source subdirectories,
+    and for Google Photos a subdirectory of an album is a different album.
+
+    Args:
+        album: Album name
+        folder: Folder relative to SOURCE_PATH ("" for the root)
+        entries: List of (relpath, size) tuples located directly in folder
+    """
+    check_quota_stop()
+    ensure_album(album)
+
+    # Google Photos matches files by name, like rclone does
+    in_album = list_album_files(album)
+    if in_album:
+        present = [relpath for relpath, _ in entries if relpath.rsplit("/", 1)[-1] in in_album]
+        if present:
+            with STATE_LOCK:
+                for relpath in present:
+                    record_done(relpath)
+            log(f"Skipping {len(present)} files already in album {album}")
+            entries = [entry for entry in entries if entry[0].rsplit("/", 1)[-1] not in in_album]
+            if not entries:
+                flush_state_wal()
+                return
+
+    # Check upload volume quota before upload
+    if not check_upload_quota(sum(size for _, size in entries)):
+        reset_time, seconds_until_reset = get_quota_reset_time()
+        raise QuotaExceededError(reset_time, seconds_until_reset)
+
+    src = f"{GDRIVE}:{SOURCE_PATH}/{folder}" if folder else f"{GDRIVE}:{SOURCE_PATH}"
+    dest = f"{GPHOTOS}:album/{album}/"
+
+    # rclone logs objects relative to src, i.e. by file name
+    pending = {relpath.rsplit("/", 1)[-1]: (relpath, size) for relpath, size in entries}
+    copied_bytes = 0  # By the current rclone call, for TRANSFER_TUNER
+
+    def handle_log(stderr):
+        """Marks files reported by rclone as copied or permanently failed."""
+        nonlocal copied_bytes
+        uploaded = []
+        for entry in parse_rclone_json_log(stderr):
+            name = entry.get("object")
+            if name not in pending:
+                continue
+            msg = entry.get("msg", "")
+            if entry.get("level") == "info" and msg.startswith("Copied"):
+                uploaded.append(pending.pop(name))
+            elif entry.get("level") == "error" and is_nonrecoverable_media_error(msg):
+                relpath, _ = pending.pop(name)
+                with STATE_LOCK:
+                    METRICS["errors"] += 1
+                mark_failed(
+                    relpath,
+                    "Google Photos rejected the media item as damaged or unsupported. "
+                    "Re-encode or inspect the original file before retrying.",
+                )
+        if uploaded:
+            record_uploaded(album, uploaded)
+            copied_bytes += sum(size for _, size in uploaded)
+            for relpath, _ in uploaded:
+                log(f"✓ Success: {relpath} → {album}")
+
+    # Retries happen here, not in rclone or run_cmd: with --no-check-dest a
+    # retry of the same list would upload the already copied files again,
+    # so every attempt gets a fresh list of the files still pending
+    failed_attempts = 0  # In a row, without any file copied
+    # Wait for a free upload slot (fewer slots while rate limited)
+    with UPLOAD_LIMITER:
+        while pending:
+            # Upload as many files as the API quota allows instead of stopping
+            # the run because the whole batch doesn't fit
+            names = list(pending)
+            fitting = files_within_quota(album, len(names))
+            if 0 < fitting < len(names):
+                log(f"Only {fitting} of {len(names)} files fit into the remaining API quota, uploading those")
+                names = names[:fitting]
+
+            with tempfile.NamedTemporaryFile(
+                "w", suffix=".txt", delete=False, encoding="utf-8"
+            ) as list_file:
+                list_file.write("\n".join(names) + "\n")
+
+            transfers = TRANSFER_TUNER.transfers
+            if RCLONE_RC:
+                # Same copy on the daemon; other flags were given to 'rclone rcd'
+                cmd = RcCall(
+                    "sync/copy",
+                    {
+                        "srcFs": src,
+                        "dstFs": dest,
+                        "_filter": {"FilesFromRaw": [list_file.name]},
+                        "_config": {
+                            "NoCheckDest": in_album is not None,
+                            "Transfers": transfers,
+                        },
+                    },
+                )
+            else:
+                cmd = [
+                    "rclone",
+                    "copy",
+                    src,
+                    dest,
+                    "--files-from-raw",
+                    list_file.name,
+                    *rclone_upload_flags(transfers),
+                    *(["--no-check-dest"] if in_album is not None else []),
+                    "--retries",
+                    "1",
+                    "--use-json-log",
+                    "--log-level",
+                    "INFO",
+                ]
+
+            batch_len = len(pending)
+            copied_bytes = 0
+            started = time.monotonic()
+            try:
+                # A failed attempt still pauses for the cooldown before raising
+                _ = run_cmd(
+                    cmd,
+                    retries=1,
+                    cooldown=30,
+                    is_gphotos_api=True,
+                    estimated_requests=estimate_requests(album, len(names)),
+                    on_stderr=handle_log,
+                    capture_stdout=False,
+                )
+                TRANSFER_TUNER.record(copied_bytes, time.monotonic() - started, transfers)
+                # rclone succeeded: files not reported as copied were already in album
+                for name in names:
+                    if name in pending:
+                        record_done(pending.pop(name)[0])
+            except QuotaExceededError:
+                # Re-raise QuotaExceededError to stop the loop
+                raise
+            except Exception as e:
+                error_message = str(e)
+                log(f"Error uploading batch {folder or '.'} → {album}: {format_rclone_error(error_message)}")
+                failed_attempts = failed_attempts + 1 if len(pending) == batch_len else 0
+                if failed_attempts >= UPLOAD_ATTEMPTS:
+                    # Damaged files are already counted in handle_log
+                    if not is_nonrecoverable_media_error(error_message):
+                        with STATE_LOCK:
+                            METRICS["errors"] += 1
+                    log(f"Giving up on {len(pending)} files of batch, left for the next run")
+                    break
+                if pending:
+                    log(f"Retrying {len(pending)} remaining files of batch")
+            finally:
+                os.unlink(list_file.name)
+                # Persist progress even if the batch was interrupted
+                flush_state_wal()
+
+
+def check_quota_stop():
+    """Raises QuotaExceededError once another upload has hit the daily quota.
+
+    Queued uploads would otherwise still list their album on Google Photos
+    before their own quota check fails.
+    """
+    if QUOTA_STOP_EVENT.is_set():
+        reset_time, seconds_until_reset = get_quota_reset_time()
+        raise QuotaExceededError(reset_time, seconds_until_reset)
+
+
+def upload_album(album, batches, on_batch_done=None):
+    """Uploads (folder, entries) batches of one album one after another.
+
+    Batches of the same album must not run in parallel: each rclone process
+    would look up a new album, not find it and create its own, leaving
+    several albums with the same title (Google Photos allows that).
+
+    Args:
+        on_batch_done: Optional callback called with the number of files in
+            each finished batch
+    """
+    check_quota_stop()
+    for folder, entries in batches:
+        try:
+            upload_batch(album, folder, entries)
+        except QuotaExceededError:
+            QUOTA_STOP_EVENT.set()
+            raise
+        if on_batch_done is not None:
+            on_batch_done(len(entries))
 
 
 def save_summary():
     METRICS["finished"] = datetime.now().isoformat()
     METRICS["duration_sec"] = round(time.time() - START_TIME, 2)
+    snapshot_state()
     # Save current quotas to metrics
     api_requests, uploaded_bytes = load_daily_quota()
+    flush_daily_quota(force=True)
     METRICS["api_requests_used"] = api_requests
     METRICS["uploaded_bytes"] = uploaded_bytes
     METRICS["failed_files"] = FAILED
-    # Create a copy for JSON serialization (sets are not JSON serializable)
-    metrics_copy = METRICS.copy()
-    metrics_copy["albums_created"] = sorted(list(METRICS["albums_created"]))
-    with open(SUMMARY_PATH, "w") as f:
-        json.dump(metrics_copy, f, indent=2, ensure_ascii=False)
+    # albums_created (a set) is written as a sorted list by json_default
+    write_file_atomic(SUMMARY_PATH, json_dumps(METRICS, indent=True))
     log(f"Report saved: {SUMMARY_PATH}")
 
 
@@ -915,16 +2060,10 @@ def get_upload_statistics(total_files=None):
         stats["progress"] = progress
         stats["total"] = total_files
     
-    # Count files by extension
-    extensions = {}
-    for file in DONE:
-        if '.' in file:
-            ext = '.' + file.split('.')[-1].lower()
-            extensions[ext] = extensions.get(ext, 0) + 1
-    
-    # Sort by count and get top file types
-    top_extensions = sorted(extensions.items(), key=lambda x: x[1], reverse=True)[:7]
-    stats["top_file_types"] = top_extensions
+    # Count files by extension (same extension rules as the upload loop)
+    extensions = Counter(file_ext(file) for file in DONE)
+    extensions.pop("", None)
+    stats["top_file_types"] = extensions.most_common(7)
     
     return stats
 
@@ -947,25 +2086,24 @@ def log_upload_statistics(total_files=None):
 
 
 def main():
-    global START_TIME, LAST_SYNC_TIME
+    global START_TIME, LAST_SYNC_TIME, RCLONE_RC
     START_TIME = time.time()
     LAST_SYNC_TIME = None  # Initialize sync
 
     log(f"Log: {LOG_PATH}")
+    if RCLONE_RC and not start_rclone_rcd():
+        log("Falling back to one rclone process per batch")
+        RCLONE_RC = False
 
     # Load daily quotas at startup (API sync happens in load_daily_quota)
     api_requests, uploaded_bytes = load_daily_quota()
     uploaded_mb = uploaded_bytes / (1024 * 1024)
     
-    # Determine quota data source (read after load_daily_quota updates it)
-    quota_source = "local"
-    if DAILY_QUOTA_FILE.exists():
-        try:
-            with open(DAILY_QUOTA_FILE, "r") as f:
-                quota_data = json.load(f)
-                quota_source = quota_data.get("quota_source", "local")
-        except Exception:
-            pass
+    if os.getenv("GOOGLE_CLOUD_PROJECT_ID"):
+        start_quota_sync()
+
+    # Determine quota data source (set by load_daily_quota)
+    quota_source = QUOTA_CACHE.get("quota_source", "local")
     
     log(
         f"Current quotas: {api_requests}/{API_QUOTA_LIMIT} requests, {uploaded_mb:.1f} MB uploaded"
@@ -976,17 +2114,11 @@ def main():
     elif quota_source == "manual":
         log("Quota tracking: using manual sync value")
     else:
-        # quota_source is "local" - check if Monitoring API is actually unavailable
-        project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-        if project_id:
-            # Try to check if Monitoring API is available (quick test)
-            test_result = get_real_quota_usage()
-            if test_result is None:
-                log("Quota tracking: using local counter")
-                log("Note: Monitoring API sync unavailable. Check credentials/permissions.")
-            else:
-                # Monitoring API works but quota_source wasn't updated yet - will sync next time
-                log("Quota tracking: using local counter (Monitoring API available, syncing...)")
+        # quota_source is "local": load_daily_quota already asked the Monitoring
+        # API (if configured) and got no value, so don't ask again here
+        if os.getenv("GOOGLE_CLOUD_PROJECT_ID"):
+            log("Quota tracking: using local counter")
+            log("Note: Monitoring API sync unavailable so far (retried in the background). Check credentials/permissions.")
         else:
             log("Quota tracking: using local counter (set GOOGLE_CLOUD_PROJECT_ID for Monitoring API sync)")
 
@@ -1001,61 +2133,107 @@ def main():
     # Log full statistics with total files count
     log_upload_statistics(total_files=total)
 
-    try:
-        processed_count = 0  # Count of files actually processed (not skipped)
-        for i, (relpath, file_size) in enumerate(files, 1):
-            if relpath in DONE:
-                continue
-            if relpath in FAILED:
-                reason = FAILED[relpath].get("reason", "previous failure")
-                log(f"Skipping previously failed file {relpath}: {reason}")
-                continue
-
-            low = relpath.lower()
-            is_photo = low.endswith(PHOTO_EXT)
-            is_video = low.endswith(VIDEO_EXT)
-            if not (is_photo or is_video):
-                continue
-
-            processed_count += 1  # Count only files that are actually processed
-            album = infer_album(relpath, is_video)
-            try:
-                upload_file(relpath, album, file_size)
-            except QuotaExceededError as e:
-                # Save limit reached information to metrics
-                METRICS["quota_exceeded"] = True
-                METRICS["quota_reset_time"] = e.reset_time.isoformat()
-                # Save state before stopping
-                json.dump(list(DONE), open(STATE_FILE, "w"))
-                save_summary()
-                log(f"Stopping due to daily quota limit reached")
-                log(
-                    f"Progress saved: {METRICS['uploaded_files']} files uploaded, {METRICS['errors']} errors"
-                )
-                log(
-                    f"Run script again after {e.reset_time.strftime('%Y-%m-%d %H:%M:%S PST')} to continue"
-                )
-                raise
+    # Drop already uploaded and previously failed files in one pass
+    new_files = [
+        (relpath, file_size)
+        for relpath, file_size in files
+        if relpath not in DONE and relpath not in FAILED
+    ]
+    skipped = total - len(new_files)
+    if skipped:
+        log(f"Skipping {skipped} already processed files (failed files are listed in {FAILED_FILE})")
+
+    # Group files by (album, folder) so each group is uploaded in batches
+    batches = defaultdict(list)
+    for relpath, file_size in new_files:
+        album = infer_album(relpath, EXT_KIND[file_ext(relpath)] == "video")
+        folder = relpath.rsplit("/", 1)[0] if "/" in relpath else ""
+        batches[(album, folder)].append((relpath, file_size))
+
+    albums = {album for album, _ in batches}
+    METRICS["albums_created"].update(albums)
+    to_upload = sum(len(entries) for entries in batches.values())
+    log(f"Files to upload: {to_upload} ({len(albums)} albums, {len(batches)} album folders)")
+
+    # One job per album, its batches run back to back (see upload_album); within
+    # a folder the largest files go first, so small ones don't leave rclone
+    # transfers idle at the end. With RCLONE_RC a batch must fit into what
+    # core/transferred reports, or uploaded files would be missed and sent again
+    batch_size = min(UPLOAD_BATCH_SIZE, RC_TRANSFERRED_LIMIT) if RCLONE_RC else UPLOAD_BATCH_SIZE
+    album_jobs = defaultdict(list)
+    for (album, folder), entries in sorted(batches.items()):
+        entries.sort(key=lambda entry: -entry[1])
+        album_jobs[album].extend(
+            (folder, entries[start : start + batch_size])
+            for start in range(0, len(entries), batch_size)
+        )
 
-            if processed_count % 100 == 0 or i == total:
-                elapsed = time.time() - START_TIME
-                rate = processed_count / elapsed if elapsed > 0 else 0
-                remaining_files = total - i  # Files remaining in the list
-                eta = remaining_files / rate / 60 if rate > 0 else 0
-                # Show current quotas in progress
-                api_requests, uploaded_bytes = load_daily_quota()
-                uploaded_mb = uploaded_bytes / (1024 * 1024)
-                log(
-                    f"Progress: {i}/{total} ({i/total*100:.1f}%) | Processed: {processed_count} | ETA ≈ {eta:.1f} min | Quotas: {api_requests}/{API_QUOTA_LIMIT} requests, {uploaded_mb:.1f} MB"
-                )
+    processed_count = 0  # Count of files actually processed (not skipped)
+    quota_error = None
+
+    def report_progress(files):
+        """Logs progress after each finished batch (called from upload threads)."""
+        nonlocal processed_count
+        with STATE_LOCK:
+            processed_count += files
+            done_count = processed_count
+        elapsed = time.time() - START_TIME
+        rate = done_count / elapsed if elapsed > 0 else 0
+        remaining_files = to_upload - done_count
+        eta = remaining_files / rate / 60 if rate > 0 else 0
+        # Show current quotas in progress
+        api_requests, uploaded_bytes = load_daily_quota()
+        uploaded_mb = uploaded_bytes / (1024 * 1024)
+        log(
+            f"Progress: {done_count}/{to_upload} ({done_count/to_upload*100:.1f}%) | ETA ≈ {eta:.1f} min | Quotas: {api_requests}/{API_QUOTA_LIMIT} requests, {uploaded_mb:.1f} MB"
+        )
 
+    # Different albums run in parallel, largest first so the last one isn't a long tail
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_UPLOADS) as executor:
+        futures = [
+            executor.submit(upload_album, album, jobs, report_progress)
+            for album, jobs in sorted(
+                album_jobs.items(), key=lambda item: -sum(len(entries) for _, entries in item[1])
+            )
+        ]
+        try:
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    future.result()
+                except QuotaExceededError as e:
+                    if quota_error is None:
+                        quota_error = e
+                        # Don't start queued albums, running ones stop on their own
+                        for f in futures:
+                            f.cancel()
+        except KeyboardInterrupt:
+            # Drop queued albums and stop running rclone processes; leaving the
+            # with block then only waits for the upload threads to wind down
+            executor.shutdown(wait=False, cancel_futures=True)
+            stop_uploads()
+            raise
+
+    if quota_error is not None:
+        # Save limit reached information to metrics
+        METRICS["quota_exceeded"] = True
+        METRICS["quota_reset_time"] = quota_error.reset_time.isoformat()
+        # Save state before stopping (save_summary snapshots it)
         save_summary()
+        log(f"Stopping due to daily quota limit reached")
         log(
-            f"Completed: {METRICS['uploaded_files']} files, {METRICS['errors']} errors."
+            f"Progress saved: {METRICS['uploaded_files']} files uploaded, {METRICS['errors']} errors"
         )
-    except QuotaExceededError:
-        # Exception already handled above, just re-raise
-        raise
+        log(
+            f"Run script again after {quota_error.reset_time.strftime('%Y-%m-%d %H:%M:%S PST')} to continue"
+        )
+        raise quota_error
+
+    save_summary()
+    log(
+        f"Completed: {METRICS['uploaded_files']} files, {METRICS['errors']} errors."
+    )
 
 
 if __name__ == "__main__":